@@ -23,31 +23,25 @@ try:
     from pathlib import Path as PyPath
 except ImportError:
     from pathlib2 import Path as PyPath
-import shutil
+try:
+    from os import scandir
+except ImportError:
+    # python3.4
+    from scandir import scandir
 import argparse
+import functools
+import re
 
 import logging
 try:
-    from subprocess import call, check_output, CalledProcessError
+    from subprocess import call, check_output, Popen, PIPE
 except ImportError:
     # python2.6
-    from subprocess32 import call, check_output, CalledProcessError
-import tempfile
-import filecmp
+    from subprocess32 import call, check_output, Popen, PIPE
+import types
+from concurrent.futures import ThreadPoolExecutor
 import platform
 
-try:
-    import argcomplete
-    # pylint: disable=unused-import
-except ImportError:
-    pass
-
-try:
-    import pytest
-    HAS_PYTEST = True
-except ImportError:
-    HAS_PYTEST = False
-
 VERSION = "0.1.4"
 
 
@@ -61,17 +55,42 @@ except AttributeError:
     # still on python3.4
     PATHS = (PyPath('/etc'), PyPath(os.path.expanduser('~')) / '.config')
 
+SYSTEM = platform.system()
+
 
 def script_path(script):
     """On Windows, append '.bat'."""
-    if platform.system() == 'Windows':
+    if SYSTEM == 'Windows':
         _ = script.stem.split('_')
         if 'pre' in _ or 'post' in _:
             return script.with_suffix('.bat')
     return script
 
 
-class Flag(object):  # pylint: disable=useless-object-inheritance
+class ResticClass(type):
+
+    """Metaclass for Flag and Command.
+
+    Every derived class registers itself in registry when it is defined,
+    unless its own body says abstract = True, and init_class() precomputes
+    names like restic_name() once per class.
+    With python3.6, __init_subclass__ could do this.
+
+    Derived classes get an empty __slots__ unless they define their own,
+    so their instances have no __dict__."""
+
+    def __new__(mcs, name, bases, namespace):
+        namespace.setdefault('__slots__', ())
+        return super().__new__(mcs, name, bases, namespace)
+
+    def __init__(cls, name, bases, namespace):
+        super().__init__(name, bases, namespace)
+        cls.init_class()
+        if not namespace.get('abstract', False):
+            cls.registry.append(cls)
+
+
+class Flag(object, metaclass=ResticClass):  # pylint: disable=useless-object-inheritance
     """
     There is a Flag class for every restic argument.
 
@@ -84,7 +103,9 @@ class Flag(object):  # pylint: disable=useless-object-inheritance
 
     """
 
-    class_type = 'Flag'
+    __slots__ = ('command', 'values', 'remove')
+    registry = []  # all classes derived from Flag
+    abstract = True  # not a restic flag, only a base class
     multi = False
     resolve_content = True
 
@@ -104,16 +125,14 @@ class Flag(object):  # pylint: disable=useless-object-inheritance
         self.command = entry.command
         self.add_values(entry)
 
+    def entry_values(self, entry):
+        """Return the values defined by entry."""
+        if self.resolve_content and not entry.values:
+            return self.__file_lines(entry)
+        return entry.values
+
     def add_values(self, entry):
-        values = entry.values
-        if self.resolve_content:
-            if not values:
-                values = self.__file_lines(entry.path)
-            if isinstance(self, BinaryFlag):
-                values = [True]
-        else:
-            if isinstance(self, FileFlag):
-                values = [entry.path]
+        values = self.entry_values(entry)
         if self.multi:
             self.values.extend(values)
         else:
@@ -125,14 +144,19 @@ class Flag(object):  # pylint: disable=useless-object-inheritance
                 self.values = values
 
     @staticmethod
-    def __file_lines(path):
+    def __file_lines(entry):
         """Return a list of all stripped lines, empty lines exclude.
-        Lines starting with # are also excluded."""
+        Lines starting with # are also excluded.
+        Always read the file: a pre script may have rewritten it."""
+        if not entry.stat().st_size:
+            return []
+        path = str(entry.path)
         try:
-            result = [x.strip() for x in open(str(path), encoding='utf-8').readlines()]
+            in_file = open(path, encoding='utf-8')
         except TypeError:
-            result = [x.strip() for x in open(str(path)).readlines()]
-        return [x for x in result if x and not x.startswith('#')]
+            in_file = open(path)
+        with in_file:
+            return [x for x in (line.strip() for line in in_file) if x and not x.startswith('#')]
 
     def __iadd__(self, other):
         """Combine other values into self."""
@@ -140,24 +164,30 @@ class Flag(object):  # pylint: disable=useless-object-inheritance
         if self.values is None:
             self.values = other.values
         elif isinstance(other.values, list):
-            self.values = self.values + other.values
+            self.values.extend(other.values)
         else:
             self.values = other.values
         return self
 
+    @classmethod
+    def init_class(cls):
+        cls._restic_name = cls.__name__.lower().replace('_', '-')
+        cls.option = '--' + cls._restic_name
+        cls.option_prefix = cls.option + '='
+        cls.dest = cls.__name__.lower()  # the argparse attribute name
+
     @classmethod
     def restic_name(cls):
-        return cls.__name__.lower().replace('_', '-')
+        return cls._restic_name
 
     def args(self):
         """Return a list of argument parts."""
-        return ['--{0}={1}'.format(self.restic_name(), x) for x in self.values]
+        return [self.option_prefix + str(x) for x in self.values]
 
     @classmethod
     def add_as_argument_for(cls, command):
         """Add this flag to the command line parser."""
-        command.cmd_parser.add_argument(
-            '--{0}'.format(cls.restic_name()))
+        command.cmd_parser.add_argument(cls.option)
 
     def apply_to(self, profile):
         flag_name = self.restic_name()
@@ -189,8 +219,10 @@ class Flag(object):  # pylint: disable=useless-object-inheritance
 
 class BinaryFlag(Flag):
 
+    abstract = True
+
     def args(self):
-        return ['--' + self.restic_name()]
+        return [self.option]
 
     def add_values(self, entry):
         pass
@@ -199,35 +231,46 @@ class BinaryFlag(Flag):
     def add_as_argument_for(cls, command):
         """Add this flag to the command line parser."""
         command.cmd_parser.add_argument(
-            '--{0}'.format(cls.restic_name()), action='store_true', default=False)
+            cls.option, action='store_true', default=False)
 
 
 class ListFlag(Flag):
     """The flag is repeated for every line in the config file."""
 
+    abstract = True
     multi = True
 
     @classmethod
     def add_as_argument_for(cls, command):
         """Add this flag to the command line parser."""
         command.cmd_parser.add_argument(
-            '--{0}'.format(cls.restic_name()), action='append')
+            cls.option, action='append')
 
 
 class FileFlag(Flag):
     """Children get PyPath values."""
+
+    abstract = True
     resolve_content = False
 
+    def entry_values(self, entry):
+        if self.resolve_content:
+            return Flag.entry_values(self, entry)
+        return [entry.path]
+
     def add_values(self, entry):
         try:
             super().add_values(entry)
         except TypeError:
             super(FileFlag, self).add_values(entry)  # pylint: disable=super-with-arguments
-        self.values = [PyPath(x) if not isinstance(x, PyPath) else x for x in self.values]
+        if not all(isinstance(x, PyPath) for x in self.values):
+            self.values = [PyPath(x) if not isinstance(x, PyPath) else x for x in self.values]
 
 
 class PositionalFlag(ListFlag):
 
+    abstract = True
+
     def args(self):
         return self.values
 
@@ -239,6 +282,7 @@ class PositionalFlag(ListFlag):
 
 class SinglePositionalFlag(PositionalFlag):
 
+    abstract = True
     multi = False
 
     @classmethod
@@ -249,6 +293,7 @@ class SinglePositionalFlag(PositionalFlag):
 
 class ScriptFlag(FileFlag):
 
+    abstract = True
     multi = True
 
     def args(self):
@@ -418,32 +463,59 @@ class ProfileEntry:
 
     # pylint: disable=too-few-public-methods
 
-    def __init__(self, path):
+    __slots__ = ('path', 'dir_entry', 'command', 'remove', 'flag_name', 'values')
+
+    def __init__(self, path, dir_entry=None):
         self.path = path
-        self.command = None
-        self.remove = False
-        if platform.system() == 'Windows' and path.suffix == '.bat':
-            path = path.with_suffix('')
-        fparts = path.parts[-1].split('_')
-        for cmd in Main.commands.values():
-            if (len(fparts) > 1 and cmd.restic_name() == fparts[0] and
-                    ((fparts[1] in Main.flags) or (fparts[1] == 'no' and fparts[2] in Main.flags))):
-                self.command = cmd.restic_name()
-                fparts = fparts[1:]  # command split off
-                break
-        if fparts[0] == 'no':
-            self.remove = True
-            fparts = fparts[1:]
-        self.flag_name = fparts[0]
-        self.values = fparts[1:]
-        if self.values and path.stat().st_size:
+        self.dir_entry = dir_entry
+        self.command, self.remove, self.flag_name, values = self.parse_name(self.flag_file_name(path.name))
+        self.values = list(values)
+        if self.values and self.stat().st_size:
             logging.error("ignoring %s: must be empty", path)
             sys.exit(2)
 
-    def flag(self):
+    @staticmethod
+    def flag_file_name(name):
+        """On Windows, the .bat suffix of scripts is not part of the name."""
+        if SYSTEM == 'Windows' and name.endswith('.bat') and len(name) > 4:
+            return name[:-4]
+        return name
+
+    @staticmethod
+    @functools.lru_cache(maxsize=1024)
+    def parse_name(name):
+        """Returns command, remove, flag_name, values.
+        The profile is scanned again after every pre script and
+        profiles often share file names, so remember the results."""
+        if '_' not in name:
+            # the most common case: only a flag name
+            return None, False, name, ()
+        command = None
+        remove = False
+        fparts = name.split('_')
+        if (len(fparts) > 1 and fparts[0] in Main.commands and
+                ((fparts[1] in Main.flags) or (fparts[1] == 'no' and fparts[2] in Main.flags))):
+            command = fparts[0]
+            fparts = fparts[1:]  # command split off
+        if fparts[0] == 'no':
+            remove = True
+            fparts = fparts[1:]
+        return command, remove, fparts[0], tuple(fparts[1:])
+
+    def stat(self):
+        """Use the stat result cached by scandir if we have one."""
+        if self.dir_entry is not None:
+            return self.dir_entry.stat()
+        return self.path.stat()
+
+    def flag(self, profile=None):
+        """Returns None if the flag does not apply to Main.command."""
         if self.command is not None and self.command != Main.command:
             return None
-        return Main.flags[self.flag_name].__class__(self)
+        flag_class = Main.flags[self.flag_name]
+        if profile is not None and not profile.accepts(flag_class):
+            return None
+        return flag_class(self)
 
     def __str__(self):
         result = 'Entry('
@@ -460,60 +532,72 @@ class Profile:
     This holds everything defined in a profile that may apply to command.
     """
 
+    __slots__ = ('options', 'flags', 'accepted', 'accepted_set', 'accepted_command', 'inherited')
+    _choices = None  # cached result of choices()
+    parallel_scan_min = 16  # read profiles with at least so many files in parallel
+
     def __init__(self, options=None):
         self.options = options
         self.flags = dict()   # key: restic_name
+        self.accepted = None  # cached by command_accepts()
+        self.accepted_set = None
+        self.accepted_command = None  # Main.command when accepted was cached
+        self.inherited = set()  # profile names already inherited
         self.inherit('default')
         if options is not None:
             self.inherit(options.profile)
             self.use_options()
 
-    @staticmethod
-    def command_accepts():
-        """Returns accepted flag classes."""
-        return Main.commands[Main.command].accepts_flags()
+    def command_accepts(self):
+        """Returns accepted flag classes.
+        Callers may set Main.command after creating the Profile."""
+        if self.accepted is None or self.accepted_command != Main.command:
+            self.accepted_command = Main.command
+            self.accepted = Main.commands[Main.command].accepts_flags()
+            self.accepted_set = frozenset(self.accepted)
+        return self.accepted
+
+    def accepts(self, flag_class):
+        self.command_accepts()
+        return flag_class in self.accepted_set
 
     def use_options(self):
         """Use options to set up profile flags."""
         opt = self.options.__dict__
+        debug = logging.getLogger().isEnabledFor(logging.DEBUG)
         for flag_class in self.command_accepts():
-            flagname = flag_class.__name__.lower()
-            if flagname in opt:
-                if opt[flagname] is not None and opt[flagname] is not False:
-                    flag = flag_class()
-                    if isinstance(opt[flagname], list):
-                        flag.values = opt[flagname]
-                    else:
-                        flag.values = [opt[flagname]]
+            value = opt.get(flag_class.dest)
+            if value is not None and value is not False:
+                flag = flag_class()
+                if isinstance(value, list):
+                    flag.values = list(value)  # __iadd__ extends it in place
+                else:
+                    flag.values = [value]
+                if debug:
                     logging.debug('option sets %s', flag.args())
-                    flag.apply_to(self)
+                flag.apply_to(self)
 
     def sorted_flags(self):
-        """Sort applicable flags to the order of specific_flags."""
-        result = []
+        """Yield applicable flags in the order of specific_flags."""
         for cls in self.command_accepts():
-            result.extend(self.find_flags(cls))
-        return result
+            flag = self.find_flag(cls)
+            if flag is not None:
+                yield flag
 
     def restic_parameters(self):
         """Return all formatted flags applicable to command."""
         for flag in self.sorted_flags():
             assert flag.values is not None, 'Flag {0} has values None'.format(flag)
-            for _ in flag.args():
-                yield _
+            yield from flag.args()
 
     def find_flags(self, flag_class):
-        result = []
-        for flag in self.flags.values():
-            if flag.__class__ is flag_class:
-                result.append(flag)
-        return result
+        flag = self.find_flag(flag_class)
+        return [] if flag is None else [flag]
 
     def find_flag(self, flag_class):
-        flags = self.find_flags(flag_class)
-        if flags:
-            assert len(flags) == 1
-            return flags[0]
+        flag = self.flags.get(flag_class.restic_name())
+        if flag is not None and flag.__class__ is flag_class:
+            return flag
         return None
 
     def pre_scripts(self):
@@ -528,50 +612,87 @@ class Profile:
 
     def scan(self, profile_name):
         """"returns an unsorted list of Flag() for all filenames applicable to Main.command"""
-        result = []
+        entries = []
         for basedir in PATHS:
-            profile_dir = basedir / 'restaround' / profile_name
-            if profile_dir.is_dir():
-                for filename in profile_dir.iterdir():
-                    if filename.name == 'README':
-                        continue
-                    if filename.name.startswith('.') and filename.name.endswith('.swp'):
-                        continue
-                    flag = ProfileEntry(profile_dir / filename).flag()
-                    if flag is not None:
-                        if flag.__class__ in self.command_accepts():
-                            result.append(flag)
-        return result
+            profile_dir = os.path.join(str(basedir), 'restaround', profile_name)
+            try:
+                dir_entries = list(scandir(profile_dir))
+            except (FileNotFoundError, NotADirectoryError):
+                continue
+            for dir_entry in dir_entries:
+                if dir_entry.name == 'README':
+                    continue
+                if dir_entry.name.startswith('.') and dir_entry.name.endswith('.swp'):
+                    continue
+                command, _, _, values = ProfileEntry.parse_name(ProfileEntry.flag_file_name(dir_entry.name))
+                if command is not None and command != Main.command:
+                    if values:
+                        # values in the name and in the file are an error for every command
+                        ProfileEntry(PyPath(dir_entry.path), dir_entry)
+                    continue
+                entries.append((PyPath(dir_entry.path), dir_entry))
+        if not entries:
+            # Main.command may not be set yet if nothing is defined
+            return []
+        self.command_accepts()  # fill the cache before the threads use it
+        if len(entries) < self.parallel_scan_min:
+            # starting threads costs more than reading a few local files
+            flags = [ProfileEntry(*x).flag(self) for x in entries]
+        else:
+            # profiles may live on a slow network file system: read the files in parallel.
+            # map() keeps the order of entries.
+            with ThreadPoolExecutor(max_workers=min(32, len(entries))) as executor:
+                flags = list(executor.map(lambda x: ProfileEntry(*x).flag(self), entries))
+        return [x for x in flags if x is not None]
 
     @classmethod
     def choices(cls):
-        result = ['help', 'selftest']
-        for basedir in PATHS:
-            dirname = basedir / 'restaround'
-            if dirname.is_dir():
-                result.extend(x.name for x in dirname.iterdir())
-        return sorted(str(x) for x in set(result) if str(x) != 'default')
+        """All profile names. Main.init_globals() resets the cache."""
+        if cls._choices is None:
+            result = set(['help', 'selftest'])
+            for basedir in PATHS:
+                try:
+                    result.update(x.name for x in scandir(os.path.join(str(basedir), 'restaround')))
+                except (FileNotFoundError, NotADirectoryError):
+                    pass
+            result.discard('default')
+            cls._choices = sorted(result)
+        return cls._choices
 
     def inherit(self, profile_name):
         """Inherit settings from other profile."""
+        if profile_name in self.inherited:
+            # a second time would duplicate values and a cycle would never end
+            return
+        self.inherited.add(profile_name)
         # command specific flags first
-        given = sorted(self.scan(profile_name), key=lambda x: x.command or '')
-        inherit_flags = [x for x in given if x.__class__ is Inherit]
-        given = [x for x in given if x.__class__ is not Inherit]
-        positive = [x for x in given if not x.remove]
-        negative = [x for x in given if x.remove]
+        inherit_flags = []
+        positive = []
+        negative = []
+        for flag in sorted(self.scan(profile_name), key=lambda x: x.command or ''):
+            if flag.__class__ is Inherit:
+                inherit_flags.append(flag)
+            elif flag.remove:
+                negative.append(flag)
+            else:
+                positive.append(flag)
         for flag in inherit_flags:
             flag.apply_to(self)
+        debug = logging.getLogger().isEnabledFor(logging.DEBUG)
         for flag in positive:
             flag.apply_to(self)
-            logging.debug('%s sets %s', profile_name, ' '.join(flag.args()) if flag.args() else flag.restic_name())
+            if debug:
+                args = flag.args()
+                logging.debug('%s sets %s', profile_name, ' '.join(args) if args else flag.restic_name())
         for flag in negative:
             flag.remove_from(self)
             logging.debug('%s removes %s', profile_name, flag.restic_name())   # for command if command
 
 
-class Command(object):  # pylint: disable=useless-object-inheritance
-    class_type = 'Command'
+class Command(object, metaclass=ResticClass):  # pylint: disable=useless-object-inheritance
+    __slots__ = ('cmd_parser', )
+    registry = []  # all classes derived from Command
+    abstract = True
     # Inherit must be first !
     general_flags = (
         Cacert, Cache_Dir, Cleanup_Cache,
@@ -593,45 +714,42 @@ class Command(object):  # pylint: disable=useless-object-inheritance
     def __init__(self):
         self.cmd_parser = None
 
-    def add_subparser(self):
+    def add_subparser(self, with_flags=True):
+        """Without flags, the subparser only makes the command name known."""
         if self.cmd_parser is None:
             self.cmd_parser = Command.subparsers.add_parser(
                 name=self.restic_name(), description=self.description)
-        for _ in self.accepts_flags():
-            Main.flags[_.restic_name()].add_as_argument_for(self)
+        if with_flags:
+            for _ in self.accepts_flags():
+                _.add_as_argument_for(self)
 
     @classmethod
     def accepts_flags(cls):
-        if cls.use_general_flags:
-            return Command.general_flags + cls.specific_flags
-        return cls.specific_flags
+        return cls._accepts_flags
 
     @staticmethod
     def run_script(script, env):
         script = script_path(script)
         if not script.exists():
             logging.warning('%s does not exist', script)
-        cmdline = 'RUN ' + str(script)
+        script_name = str(script)
+        cmdline = 'RUN ' + script_name
         logging.info(cmdline)
-        try:
-            process_stdout = check_output(str(script), env=env)
-            process_returncode = 0
-        except CalledProcessError as exc:
-            process_stdout = exc.output
-            process_returncode = exc.returncode
-        if process_stdout:
-            for line in process_stdout.split(b'\n'):
-                line = line.decode('utf-8')
-                line = line.replace('\r', '')
+        has_output = False
+        # read the output while the script runs instead of collecting all of it
+        with Popen(script_name, env=env, stdout=PIPE) as process:
+            for line in process.stdout:
+                has_output = True
+                line = line.decode('utf-8').replace('\r', '').rstrip('\n')
                 if '=' in line:
-                    if platform.system() == 'Windows' and line.startswith('"') and line.endswith('"'):
+                    if SYSTEM == 'Windows' and line.startswith('"') and line.endswith('"'):
                         line = line[1:-1]
-                    parts = line.split('=')
-                    key = parts[0]
-                    value = '='.join(parts[1:])
-                    if platform.system() == 'Windows' and value.startswith('"') and value.endswith('"'):
+                    key, _, value = line.partition('=')
+                    if SYSTEM == 'Windows' and value.startswith('"') and value.endswith('"'):
                         value = value[1:-1]
                     env[key] = value
+        process_returncode = process.returncode
+        if has_output:
             new_output = env.get('RESTAROUND_OUTPUT')
             if new_output:
                 Main.logger_dict['filename'] = new_output
@@ -657,14 +775,16 @@ class Command(object):  # pylint: disable=useless-object-inheritance
 
     @classmethod
     def is_supported(cls):
-        return platform.system() == 'Linux' or cls.runs_on_windows
+        return SYSTEM == 'Linux' or cls.runs_on_windows
 
     def run(self, profile, options):
         if options.dry:
             logging.info('RUN %s', ' '.join(self.run_args(profile)))
             return 0
-        env = os.environ.copy()
+        env = None  # only copy os.environ if there are scripts
         for pre_script in profile.pre_scripts():
+            if env is None:
+                env = os.environ.copy()
             env, returncode = self.run_script(pre_script, env)
             if returncode:
                 logging.warning('Aborting because script %s returned exit code %d', pre_script, returncode)
@@ -672,8 +792,12 @@ class Command(object):  # pylint: disable=useless-object-inheritance
             # now rescan, the script may have changed files
             profile = Profile(profile.options)
         returncode = self.run_command(profile, options)
-        env['RESTIC_EXITCODE'] = str(returncode)
-        for post_script in profile.post_scripts():
+        post_scripts = list(profile.post_scripts())
+        if post_scripts:
+            if env is None:
+                env = os.environ.copy()
+            env['RESTIC_EXITCODE'] = str(returncode)
+        for post_script in post_scripts:
             self.run_script(post_script, env)
         return returncode
 
@@ -690,9 +814,17 @@ class Command(object):  # pylint: disable=useless-object-inheritance
         Command.subparsers._name_parser_map[  # pylint: disable=protected-access
             cls.restic_name()].print_help()
 
+    @classmethod
+    def init_class(cls):
+        cls._restic_name = cls.__name__.lower().replace('_', '-')[3:]
+        if cls.use_general_flags:
+            cls._accepts_flags = cls.general_flags + cls.specific_flags
+        else:
+            cls._accepts_flags = cls.specific_flags
+
     @classmethod
     def restic_name(cls):
-        return cls.__name__.lower().replace('_', '-')[3:]
+        return cls._restic_name
 
     def __str__(self):
         return 'Command({0})'.format(self.restic_name())
@@ -730,7 +862,9 @@ class CmdCpal(Command):
         if repo_flag is None:
             logging.error('%s needs --repo', Main.command)
             sys.exit(2)
-        return repo_flag.values[0]
+        repo = repo_flag.values[0]
+        # a value from the command line is a str
+        return repo if isinstance(repo, PyPath) else PyPath(repo)
 
     def copydir(self, profile):
         repodir = self.repo(profile)
@@ -739,15 +873,15 @@ class CmdCpal(Command):
     def run_args(self, profile):
         return ['cp', '-al', str(self.repo(profile)), str(self.copydir(profile))]
 
-    def repo_parent(self, profile):
-        return PyPath(os.path.normpath(os.path.join(str(self.repo(profile)), '..')))
+    def repo_parent(self, profile, repo=None):
+        if repo is None:
+            repo = self.repo(profile)
+        # not os.path.dirname: that would return the repo itself for a trailing slash
+        return os.path.normpath(os.path.join(str(repo), '..'))
 
     def check_same_fs(self, profile):
-        repo = PyPath(str(self.repo(profile)))
-        repo_parent = self.repo_parent(profile)
-        repo_dev = repo.stat().st_dev
-        repo_parent_dev = repo_parent.stat().st_dev
-        if repo_parent_dev != repo_dev:
+        repo = self.repo(profile)
+        if os.stat(str(repo)).st_dev != os.stat(self.repo_parent(profile, repo)).st_dev:
             logging.error(
                 '%s: %s is a mount point, this is not supported',
                 Main.command, repo)
@@ -897,6 +1031,12 @@ class CmdKey(Command):
 
 class CmdSelftest(Command):
     use_general_flags = False
+    flag_in_help = re.compile(r'--([^ ]*)')  # finds the flag name in a help line
+    will_not_implement_command = frozenset((
+        'help', 'cache', 'generate', 'key', 'migrate', 'self-update', 'version'))
+    will_not_implement_flags = frozenset((
+        'option', 'help', 'inherit', 'mountpoint', 'pattern', 'dir',
+        'pre', 'post', 'direct', 'snapshotid', 'singlesnapshotid', 'filedir', 'objects'))
 
     description = """
         This executes several tests. It also checks if all commands and possible arguments of the
@@ -908,87 +1048,103 @@ class CmdSelftest(Command):
 
     def check_restic(self):
         returncode = 0
-        will_not_implement_command = (
-            'help', 'cache', 'generate', 'key', 'migrate', 'self-update', 'version')
-        will_not_implement_flags = set((
-            'option', 'help', 'inherit', 'mountpoint', 'pattern', 'dir',
-            'pre', 'post', 'direct', 'snapshotid', 'singlesnapshotid', 'filedir', 'objects'))
-        commands = self.parse_general_help()
+        commands = [x for x in self.parse_general_help() if x not in self.will_not_implement_command]
+        supported = [x for x in commands if x in Main.commands]
+        # every restic help call is a separate process: run them in parallel
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            help_flags = dict(zip(supported, executor.map(self.parse_command_help, supported)))
+        general_flags = set(x.restic_name() for x in Command.general_flags)
         for command in commands:
-            if command in will_not_implement_command:
-                continue
             if command not in Main.commands:
                 logging.warning('restic %s is not supported', command)
                 returncode += 1
                 continue
-            restic_flags = set(x.restic_name() for x in Main.commands[command].accepts_flags())
-            flags_in_help = self.parse_command_help(command)
-            for unimplemented in flags_in_help - restic_flags - will_not_implement_flags:
+            restic_flags = set(x.restic_name() for x in Main.commands[command].specific_flags)
+            if Main.commands[command].use_general_flags:
+                restic_flags |= general_flags
+            flags_in_help = help_flags[command]
+            for unimplemented in flags_in_help.difference(restic_flags, self.will_not_implement_flags):
                 logging.warning('restic %s --%s is not implemented', command, unimplemented)
                 returncode += 1
-            for too_much in restic_flags - flags_in_help - will_not_implement_flags:
+            for too_much in restic_flags.difference(flags_in_help, self.will_not_implement_flags):
                 logging.warning('restaround %s --%s is not supported by restic', command, too_much)
                 returncode += 1
         return returncode
 
     @staticmethod
     def run_pytest():
-        if not HAS_PYTEST:
+        try:
+            import pytest  # pylint: disable=import-outside-toplevel
+        except ImportError:
             logging.warning('please install pytest: "pip install -U pytest"')
             return 1
-        with tempfile.TemporaryDirectory() as tmpdir:
-            path = shutil.which('restaround')
-            tmpfile = shutil.copyfile(path, os.path.join(tmpdir, 'restaround_test.py'))
-            # parallel execution: install pytest-xdist return pytest.main(['-n', '6', '-vv', tmpfile])
-            return pytest.main(['-vv', tmpfile])
+        args = ['-vv', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'test_restaround.py')]
+        try:
+            import xdist  # pylint: disable=import-outside-toplevel, unused-import
+            args = ['-n', 'auto'] + args  # parallel execution
+        except ImportError:
+            pass
+        return pytest.main(args)
 
     @staticmethod
     def parse_general_help():
-        header_section = False
-        flags_section = False
+        commands_section = False
         commands = []
-        global_flags = []
         try:
-            help_stdout = check_output(['restic', 'help'])
+            help_stdout = check_output(['restic', 'help']).decode('utf-8')
         except FileNotFoundError:
             logging.error('Please install restic, see https://restic.readthedocs.io/en/stable/020_installation.html')
             sys.exit(2)
-        for _ in help_stdout.split(b'\n'):
-            _ = _.decode('utf-8').strip()
+        for _ in help_stdout.splitlines():
+            _ = _.strip()
             if not _:
-                header_section = False
-                flags_section = False
-            if _.endswith('Commands:'):
-                header_section = True
-                continue
-            if _.endswith('Flags:'):
-                flags_section = True
-                continue
-            if header_section:
+                commands_section = False
+            elif _.endswith('Commands:'):
+                commands_section = True
+            elif commands_section and not _.endswith('Flags:'):
                 commands.append(_.split(' ')[0])
-            elif flags_section:
-                global_flags.append(_.split('--')[1].split(' ')[0])
         return commands
 
     @staticmethod
     def parse_command_help(command):
         flags_in_help = set()
-        help_command = check_output(['restic', 'help', command])
+        help_command = check_output(['restic', 'help', command]).decode('utf-8')
         header_seen = False
-        for _ in help_command.split(b'\n'):
-            _ = _.decode('utf-8').strip()
+        for _ in help_command.splitlines():
+            _ = _.strip()
             if _ == 'Flags:':
                 header_seen = True
                 continue
             if header_seen and ' --' in _ or _.startswith('--'):
-                flag = _.split('--')[1].split(' ')[0]
-                flags_in_help.add(flag)
+                flags_in_help.add(CmdSelftest.flag_in_help.search(_).group(1))
         return flags_in_help
 
+class CommandFinder(argparse.ArgumentParser):
+
+    """Only finds profile and command in the command line.
+    Everything else goes into the unknown arguments."""
+
+    def __init__(self):
+        super().__init__(add_help=False)
+        self.add_argument('-n', '--dry', action='store_true')
+        self.add_argument('-l', '--loglevel')
+        self.add_argument('-o', '--output')
+        self.add_argument('-e', '--stderr')
+        self.add_argument('profile', nargs='?')
+        self.add_argument('command', nargs='?')
+
+    def error(self, message):
+        """The real parser will complain."""
+        raise ValueError(message)
+
+
 class Main:
 
-    commands = dict()
-    flags = dict()
+    commands = dict()  # key: restic_name, value: Command instance
+    flags = dict()  # key: restic_name, value: Flag class
+    parser = None  # cached by build_parser()
+    parser_key = None  # commands with flags of the cached parser
+    profile_action = None  # the profile argument of the cached parser
     logger_dict = dict()
     command = None
     run_history = []  # tuple: RUN-Command, returncode, returned variables (by Pre)
@@ -996,11 +1152,14 @@ class Main:
 
     def __init__(self, argv):
         self.init_globals()
-        parser = self.build_parser()
-        try:
-            argcomplete.autocomplete(parser)
-        except NameError:
-            pass
+        parser = self.build_parser(self.commands_needing_flags(argv))
+        if '_ARGCOMPLETE' in os.environ:
+            # only import argcomplete when the shell asks for completion
+            try:
+                import argcomplete  # pylint: disable=import-outside-toplevel
+                argcomplete.autocomplete(parser)
+            except ImportError:
+                pass
         options = self.prepare_options(parser, argv)
         Main.logger_dict['level'] = options.loglevel
         self.startLogger()
@@ -1009,7 +1168,7 @@ class Main:
         os.environ['RESTAROUND_DRY_RUN'] = '1' if options.dry else '0'
         os.environ['RESTAROUND_LOGLEVEL'] = options.loglevel
         if options.profile == 'help':
-            self.returncode = Main.commands['help'].__class__().run(options.profile, options)
+            self.returncode = Main.commands['help'].run(options.profile, options)
             Main.command = 'help'
         else:
             if options.profile == 'selftest':
@@ -1019,7 +1178,7 @@ class Main:
                 Main.command = options.subparser_name
                 profile = Profile(options)
             os.environ['RESTAROUND_COMMAND'] = Main.command
-            self.returncode = Main.commands[Main.command].__class__().run(profile, options)
+            self.returncode = Main.commands[Main.command].run(profile, options)
         if self.returncode and self.returncode % 256 == 0:
             self.returncode -= 1
 
@@ -1063,16 +1222,43 @@ class Main:
     @staticmethod
     def init_globals():
         Main.run_history = []
-        Main.commands = dict()
-        for x in Main.find_classes(Command):
-            Main.commands[x.restic_name()] = x
-        Main.flags = dict()
-        for x in Main.find_classes(Flag):
-            if not x.__class__.__name__.endswith('Flag'):
-                Main.flags[x.restic_name()] = x
+        Profile._choices = None
+
+    @staticmethod
+    def init_classes():
+        """commands and flags only depend on the source code.
+        This is called once when the module is imported, afterwards
+        they are read only."""
+        Main.commands = types.MappingProxyType(dict((x.restic_name(), x()) for x in Command.registry))
+        Main.flags = types.MappingProxyType(dict((x.restic_name(), x) for x in Flag.registry))
+
+    @staticmethod
+    def commands_needing_flags(argv):
+        """Adding all flags to all subparsers is expensive. Only do that for
+        the command given in argv, or for all commands if that is unclear."""
+        if '_ARGCOMPLETE' in os.environ:
+            return Main.commands.keys()
+        parser = CommandFinder()
+        try:
+            found = parser.parse_known_args(argv[1:])[0]
+        except ValueError:
+            return Main.commands.keys()
+        if found.profile is None:
+            # only top level options like --help
+            return ()
+        if found.command in Main.commands:
+            return (found.command, )
+        if found.command is None and found.profile in ('help', 'selftest'):
+            return ()
+        return Main.commands.keys()
 
     @staticmethod
-    def build_parser():
+    def build_parser(commands_with_flags):
+        key = frozenset(commands_with_flags)
+        if Main.parser is not None and Main.parser_key == key:
+            # only the profiles may have changed since
+            Main.profile_action.choices = Profile.choices()
+            return Main.parser
         parser = argparse.ArgumentParser(description="""
           Makes using restic simpler with the help of profiles. Profile 'default' is
           always used.
@@ -1087,480 +1273,22 @@ class Main:
             '-o', '--output', help='write standard output into file')
         parser.add_argument(
             '-e', '--stderr', help='write error output into file')
-        parser.add_argument(
+        Main.profile_action = parser.add_argument(
             'profile', nargs=1, choices=Profile.choices(), help="""
             Use PROFILE. A relative name is first looked for
             in ~/.config/restaround/, then in /etc/restaround/""")
         Command.subparsers = parser.add_subparsers(dest='subparser_name')
-        for _ in Main.commands.values():
-            _.add_subparser()
+        for name, command in Main.commands.items():
+            command.cmd_parser = None
+            command.add_subparser(with_flags=name in commands_with_flags)
 
+        Main.parser = parser
+        Main.parser_key = key
         return parser
 
-    @staticmethod
-    def find_classes(wanted_type):
-        wanted_name = wanted_type.__name__
-        result = list()
-        for glob in globals().values():
-            if hasattr(glob, 'class_type'):
-                if glob is not wanted_type and glob.class_type == wanted_name:
-                    try:
-                        instance = glob()
-                    except Exception:
-                        logging.error('cannot instantiate %s', glob.__name__)
-                        raise
-                    result.append(instance)
-        return result
-
-
-class Test_restaround:
-
-    # pylint: disable=too-many-public-methods
 
-    profiles = []
-    tmpdir = None
-    test_env = None
-    repo1 = None
-
-    def setup_method(self):
-        self.tmpdir = PyPath(tempfile.mkdtemp())
-        global PATHS  # pylint: disable=global-statement
-        Main.init_globals()
-        PATHS = (self.tmpdir / 'etc', self.tmpdir / 'user')
-        self.profiles = {}
-        self.test_env = os.environ.copy()
-        self.repo1 = self.tmpdir / 'repösitory 1 €=EUR'
-
-    def teardown_method(self):
-        shutil.rmtree(str(self.tmpdir))
-        self.profiles = {}
-
-    @staticmethod
-    def is_script(key):
-        return 'pre' in key.split('_') or 'post' in key.split('_')
-
-    def define_profile(self, path_idx, name, content):
-        path = PATHS[path_idx] / 'restaround' / name
-        path.mkdir(parents=True)
-        self.profiles[name] = path
-        for key, value in content.items():
-            full_path = script_path(path / key)
-            if value is None:
-                full_path.touch()
-            else:
-                if platform.system() == 'Windows' and isinstance(value, str):
-                    value = value.replace('#!/bin/bash', '')
-                    value = value.replace('REPOFILE', str(path / 'repo'))
-                full_path.write_text(str(value) + '\n')
-                if self.is_script(key):
-                    full_path.chmod(0o755)
-        return path
-
-    @staticmethod
-    def compare_history(got_history, expect_hist):
-        assert len(got_history) == len(expect_hist), 'got:%s' % got_history
-        for idx, expect_entry in enumerate(expect_hist):
-            got = got_history[idx]
-            assert expect_entry[0] == got[0], 'RUN command differs'
-            assert expect_entry[1] == got[1], 'exit code differs for {0}'.format(got[0])
-            for key, value in expect_entry[2].items():
-                assert ': '.join([key, value]) == ': '.join([key, got[2][key]])
-
-    @staticmethod
-    def compare_directories(a, b):
-        cmp = filecmp.dircmp(str(a), str(b))
-        assert not cmp.left_only
-        assert not cmp.right_only
-        assert not cmp.diff_files
-
-    def run_test(self, profile, args, expect):
-        Main.run_history = []
-        argv = ['restaround', '--loglevel=debug', profile.name]
-        argv.extend(args)
-        main = Main([str(x) for x in argv])
-        self.compare_history(main.run_history, expect)
-
-    def run_init(self, profile):
-        repo = ProfileEntry(profile / 'repo').flag().values[0]
-        self.run_test(profile, ['init'], [(
-            'RUN restic init --password-file={0} --repo={1}'.format(
-                profile / 'password-file',
-                repo,
-            ), 0, {}), ])
-        assert (repo / 'locks').is_dir()
-
-    def test_init(self):
-        profile = self.define_profile(1, 'profile with Umläut', {
-            'repo': self.repo1,
-            'password-file': 'secret password'})
-        self.run_init(profile)
-
-    if HAS_PYTEST:
-        @pytest.mark.skipif(platform.system() != 'Linux', reason='not for Linux')
-        def test_script_path_linux(self):
-            profile_name = 'profile with Umlaut'
-            profile = self.define_profile(1, profile_name, {
-                'repo': self.repo1,
-                'pre': '\n'.join([
-                    '#!/bin/bash',
-                    'echo VALB=$0'
-                    ]),
-                'password-file': 'secret password'})
-            prof = Profile()
-            Main.command = 'init'  # needed for inherit()
-            prof.inherit(profile_name)
-            self.run_test(profile, ['init'], [
-                ('RUN ' + str(script_path(profile / 'pre')), 0, {'VALB': str(next(prof.pre_scripts()))}),
-                ('RUN restic init --password-file={0} --repo={1}'.format(
-                    profile / 'password-file',
-                    self.repo1,
-                ), 0, {})])
-
-        @pytest.mark.skipif(platform.system() != 'Windows', reason='only for Windows')
-        def test_script_path_windows(self):
-            profile_name = 'profile with Umlaut'
-            profile = self.define_profile(1, profile_name, {
-                'repo': self.repo1,
-                'pre': '\n'.join([
-                    '@echo off',
-                    'echo VALB=%0'
-                    ]),
-                'password-file': 'secret password'})
-            prof = Profile()
-            Main.command = 'init'  # needed for inherit()
-            prof.inherit(profile_name)
-            self.run_test(profile, ['init'], [
-                ('RUN ' + str(script_path(profile / 'pre')), 0, {'VALB': str(next(prof.pre_scripts()))}),
-                ('RUN restic init --password-file={0} --repo={1}'.format(
-                    profile / 'password-file',
-                    self.repo1,
-                ), 0, {})])
-
-        @pytest.mark.skipif(platform.system() != 'Linux', reason='only for Linux')
-        def test_pre_fail_linux(self):
-            profile = self.define_profile(1, 'my_profile', {
-                'repo': self.repo1,
-                'pre': '\n'.join([
-                    '#!/bin/bash',
-                    'echo "VALA=bcde=f"',
-                    'exit 0']),
-                'init_pre': '\n'.join([
-                    '#!/bin/bash',
-                    'echo "VALB=ccde=f"',
-                    'echo "RA_DR=$RESTAROUND_DRY_RUN"',
-                    'echo "RA_PID=$RESTAROUND_PID"',
-                    'echo "RA_PR=$RESTAROUND_PROFILE"',
-                    'echo "RA_LL=$RESTAROUND_LOGLEVEL"',
-                    'exit 3']),
-                'password-file': 'secret password'})
-            self.run_test(profile, ['init'], [
-                ('RUN ' + str(script_path(profile / 'pre')), 0, {'VALA': 'bcde=f'}),
-                ('RUN ' + str(script_path(profile / 'init_pre')), 3, {
-                    'VALA': 'bcde=f', 'VALB': 'ccde=f',
-                    'RA_DR': '0', 'RA_PID': str(os.getpid()),
-                    'RA_PR': 'my_profile', 'RA_LL': 'debug'})])
-
-        @pytest.mark.skipif(platform.system() != 'Windows', reason='only for Windows')
-        def test_pre_fail_windows(self):
-            profile = self.define_profile(1, 'my_profile', {
-                'repo': self.repo1,
-                'pre': '\n'.join([
-                    '@echo off',
-                    'echo VALA=bcde=f',
-                    'exit 0']),
-                'init_pre': '\n'.join([
-                    '@echo off',
-                    'echo "VALB=ccde=f"',
-                    'echo "RA_DR=%RESTAROUND_DRY_RUN%"',
-                    'echo "RA_PID=%RESTAROUND_PID%"',
-                    'echo "RA_PR=%RESTAROUND_PROFILE%"',
-                    'echo "RA_LL=%RESTAROUND_LOGLEVEL%"',
-                    'exit 3']),
-                'password-file': 'secret password'})
-            self.run_test(profile, ['init'], [
-                ('RUN ' + str(script_path(profile / 'pre')), 0, {'VALA': 'bcde=f'}),
-                ('RUN ' + str(script_path(profile / 'init_pre')), 3, {
-                    'VALA': 'bcde=f', 'VALB': 'ccde=f',
-                    'RA_DR': '0', 'RA_PID': str(os.getpid()),
-                    'RA_PR': 'my_profile', 'RA_LL': 'debug'}),
-                ])
-
-    def test_pre_post(self):
-        profile = self.define_profile(1, 'my_profile', {
-            'repo': self.repo1,
-            'pre': '\n'.join([
-                '#!/bin/bash',
-                'echo VALA="bcde=f"',
-                'exit 0']),
-            'init_pre': '\n'.join([
-                '#!/bin/bash',
-                'echo "VALB=ccde=f"',
-                'exit 0']),
-            'post': '\n'.join([
-                '#!/bin/bash',
-                'exit 0']),
-            'password-file': 'secret password'})
-        self.run_test(profile, ['init'], [
-            ('RUN ' + str(script_path(profile / 'pre')), 0, {}),
-            ('RUN ' + str(script_path(profile / 'init_pre')), 0, {}),
-            ('RUN restic init --password-file={0} --repo={1}'.format(
-                profile / 'password-file',
-                self.repo1,
-            ), 0, {}),
-            ('RUN ' + str(script_path(profile / 'post')), 0, {})])
-
-    def test_path(self):
-        profile = self.define_profile(1, 'my_profile', {
-            'repo': self.repo1,
-            'password-file': 'secret password',
-            'path': '/path1\n/path2'})
-        self.run_test(profile, ['init'], [(
-            'RUN restic init --password-file={0} --repo={1}'.format(
-                profile / 'password-file',
-                self.repo1,
-            ), 0, {}), ])
-        self.run_test(profile, ['snapshots'], [(
-            'RUN restic snapshots --password-file={0} --repo={1} --path=/path1 --path=/path2'.format(
-                profile / 'password-file',
-                self.repo1,
-            ), 0, {}), ])
-
-    def test_excludefile2(self):
-        """Have 2 exclude-files"""
-        default_profile = self.define_profile(0, 'default', {
-            'exclude-file': 'default_filea\ndefault_dirb\ndefault_dirc\n'})
-        profile = self.define_profile(1, 'my_profile', {
-            'repo': self.repo1,
-            'exclude-file': '_filea\n_dirb\n_dirc\n',
-            'password-file': 'secret password',
-            'path': '/path1\n/path2'})
-        self.run_init(profile)
-        self.run_test(profile, ['backup', PATHS[0]], [(
-            'RUN restic backup --password-file={0} --repo={1} --exclude-file={2} --exclude-file={3} {4}'.format(
-                profile / 'password-file',
-                self.repo1,
-                default_profile / 'exclude-file',
-                profile / 'exclude-file',
-                PATHS[0]), 0, {}), ])
-
-    def test_order(self):
-        self.define_profile(0, 'default', {
-            'verbose': '1',
-            'exclude-caches': None})
-        self.define_profile(1, 'profile repo', {
-            'repo': self.repo1})
-        profile = self.define_profile(1, 'Real profile with Umläut', {
-            'verbose_4': None,
-            'init_verbose_3': None,
-            'inherit_profile repo': None,
-            'password-file': 'secret password'})
-        profile3 = self.define_profile(1, 'level3', {
-            'backup_no_verbose': None,
-            'inherit': 'Real profile with Umläut'})
-        self.run_test(profile, ['init'], [(
-            'RUN restic init --password-file={0} --repo={1} --verbose=3'.format(
-                profile / 'password-file',
-                self.repo1,
-            ), 0, {}), ])
-        self.run_test(profile3, ['backup', PATHS[0]], [(
-            'RUN restic backup --password-file={0} --repo={1} --exclude-caches {2}'.format(
-                profile / 'password-file',
-                self.repo1,
-                PATHS[0]), 0, {}), ])
-        self.run_test(profile, ['backup', '--verbose=9', PATHS[0]], [(
-            'RUN restic backup --password-file={0} --repo={1} --verbose=9 --exclude-caches {2}'.format(
-                profile / 'password-file',
-                self.repo1,
-                PATHS[0]), 0, {}), ])
-
-    def test_tag(self):
-        profile = self.define_profile(1, 'pr', {
-            'repo': self.repo1,
-            'add_one_two_tag': None,
-            'add': 'four\nfive',
-            'host_mysystem_othersystem': None,
-            'path': '/',
-            'set': 'overwrite',
-            'snapshotid': 'SNID\nID2',
-            'password-file': 'secret password'})
-        self.run_init(profile)
-        self.run_test(profile, ['tag'], [(
-            'RUN restic tag --password-file={0} --repo={1} --add=four --add=five --add=one --add=two --add=tag ' \
-            '--host=mysystem --host=othersystem --path=/ --set=overwrite SNID ID2'.format(
-                profile / 'password-file', self.repo1), 1, {})])
-
-    if HAS_PYTEST:
-        @pytest.mark.skipif(platform.system() != 'Linux', reason='Only for Linux')
-        def test_rescan_linux(self):
-            default_profile = self.define_profile(0, 'default', {
-                'password-file': 'secret password',
-                'pre': '\n'.join([
-                    '#!/bin/bash',
-                    'filename=$(dirname $0)/repo',
-                    'echo {0} >$filename'.format(self.repo1)]),
-                'exclude-caches': None})
-            profile = self.define_profile(0, 'real', {
-                'password-file': 'secret password'
-                })
-            self.run_test(profile, ['init'], [
-                ('RUN ' + str(script_path(default_profile / 'pre')), 0, {}),
-                ('RUN restic init --password-file={0} --repo={1}'.format(
-                    profile / 'password-file',
-                    self.repo1,
-                ), 0, {}), ])
-
-        @pytest.mark.skipif(platform.system() != 'Windows', reason='only for Windows')
-        def test_rescan_windows(self):
-            default_profile = self.define_profile(0, 'default', {
-                'password-file': 'secret password',
-                'pre': '\n'.join([
-                    '@echo off',
-                    'echo {0} >REPOFILE'.format(self.repo1)]),
-                'exclude-caches': None})
-            profile = self.define_profile(0, 'real', {
-                'password-file': 'secret password'
-                })
-            self.run_test(profile, ['init'], [
-                ('RUN ' + str(script_path(default_profile / 'pre')), 0, {}),
-                ('RUN restic init --password-file={0} --repo={1}'.format(
-                    profile / 'password-file',
-                    self.repo1,
-                ), 0, {}), ])
-
-    def test_backup(self):
-        parent_profile = self.define_profile(1, 'parent', {
-            'repo': self.repo1,
-            'password-file': 'secret password',
-            })
-        profile = self.define_profile(1, 'pr', {
-            'add_one_two_tag': None,
-            'inherit_parent': None,
-            'add': 'four\nfive',
-            'host_mysystem': None,
-            'cache-dir': '/tmp',
-            'limit-upload': 500,
-            'limit-download': 1000,
-            'path': '/',
-            'filedir': PATHS[1],
-            'set': 'overwrite',
-            'snapshotid': 'SNID\nID2',
-            })
-        self.run_init(parent_profile)
-        self.run_test(profile, ['backup'], [(
-            'RUN restic backup ' \
-            '--cache-dir={0}tmp --limit-download=1000 --limit-upload=500 ' \
-            '--password-file={1} --repo={2} --host=mysystem {3}'.format(
-                os.sep,
-                parent_profile / 'password-file',
-                self.repo1, PATHS[1],
-                ), 0, {})])
-
-    def test_snapshots_forget(self):
-        parent_profile = self.define_profile(1, 'parent', {
-            'repo': self.repo1,
-            'filedir': PATHS[1],
-            'password-file': 'secret password'})
-        profile = self.define_profile(1, 'pr', {
-            'inherit_parent': None,
-            'add_one_two_tag': None,
-            'add': 'four\nfive',
-            'keep-last': 5,
-            'keep-hourly': 6,
-            'keep-monthly': 7,
-            'keep-yearly': 8,
-            'keep-within': '1y5m7d2h',
-            'keep-tag_a_b': None,
-            'host_mysystem': None,
-            'tag_a_b_c': None,
-            'compact': None,
-            'group-by': 'paths',
-            'prune': None,
-            'set': 'overwrite',
-            })
-        self.run_init(parent_profile)
-        self.run_test(profile, ['backup'], [(
-            'RUN restic backup ' \
-            '--password-file={0} --repo={1} ' \
-            '--host=mysystem --tag=a --tag=b --tag=c {2}'.format(
-                parent_profile / 'password-file',
-                self.repo1,
-                PATHS[1],
-            ), 0, {})])
-        self.run_test(profile, ['snapshots'], [(
-            'RUN restic snapshots ' \
-            '--password-file={0} --repo={1} --compact --group-by=paths ' \
-            '--host=mysystem ' \
-            '--tag=a --tag=b --tag=c'.format(
-                parent_profile / 'password-file', self.repo1), 0, {})])
-        self.run_test(profile, ['ls', '--recursive', 'latest', '/'], [(
-            'RUN restic ls ' \
-            '--password-file={0} --repo={1} ' \
-            '--host=mysystem --recursive ' \
-            '--tag=a --tag=b --tag=c latest /'.format(
-                parent_profile / 'password-file', self.repo1), 0, {})])
-        self.run_test(profile, ['forget', 'latest'], [(
-            'RUN restic forget ' \
-            '--password-file={0} --repo={1} ' \
-            '--keep-last=5 ' \
-            '--keep-hourly=6 --keep-monthly=7 --keep-yearly=8 --keep-within=1y5m7d2h ' \
-            '--keep-tag=a --keep-tag=b --host=mysystem --tag=a --tag=b --tag=c --compact --group-by=paths --prune latest'.format(
-                parent_profile / 'password-file', self.repo1), 0, {})])
-
-    if HAS_PYTEST:
-        @pytest.mark.skipif(platform.system() != 'Linux', reason='Windows: restore path problem')
-        def test_restore(self):
-            target_dir = self.tmpdir / 'restore_target'
-            profile = self.define_profile(1, 'pr', {
-                'repo': self.repo1,
-                'filedir': PATHS[1],
-                'exclude': 'patterna\n**.tmp\n/cache',
-                'password-file': 'secret password',
-                'target': target_dir,
-                })
-            self.run_init(profile)
-            self.run_test(profile, ['backup'], [(
-                'RUN restic backup ' \
-                '--password-file={0} --repo={1} ' \
-                '--exclude=patterna --exclude=**.tmp --exclude=/cache {2}'.format(
-                    profile / 'password-file',
-                    self.repo1,
-                    PATHS[1]), 0, {}), ])
-            self.run_test(profile, ['restore', 'latest'], [(
-                'RUN restic restore ' \
-                '--password-file={0} --repo={1} ' \
-                '--exclude=patterna --exclude=**.tmp --exclude=/cache --target={2} latest'.format(
-                    profile / 'password-file',
-                    self.repo1, target_dir,
-                    ), 0, {}), ])
-            self.compare_directories(PATHS[1], target_dir / PyPath(str(self.tmpdir)[1:]) / 'user')
-
-        @pytest.mark.skipif(not CmdCpal.is_supported(), reason='not supported on Windows')
-        def test_cpal(self):
-            # 1. normal, mit rmcpal
-            # 2. repo=sftp....
-            profile = self.define_profile(1, 'pr', {
-                'repo': self.repo1,
-                'filedir': PATHS[1],
-                'password-file': 'secret password',
-                })
-            self.run_init(profile)
-            self.run_test(profile, ['backup'], [(
-                'RUN restic backup ' \
-                '--password-file={0} --repo={1} {2}'.format(
-                    profile / 'password-file',
-                    self.repo1,
-                    PATHS[1]), 0, {}), ])
-
-            cp_path = PyPath(str(self.repo1) + '.restaround_cpal')
-            self.run_test(profile, ['cpal'], [(
-                'RUN cp -al {0} {1}'.format(
-                    self.repo1,
-                    str(cp_path)), 0, {}), ])
-            assert cp_path.exists()
-            self.compare_directories(self.repo1, cp_path)
-            self.run_test(profile, ['rmcpal'], [(
-                'RUN rm -r {0}'.format(str(cp_path)), 0, {}), ])
-            assert not cp_path.exists()
+if not Main.commands:
+    Main.init_classes()
 
 
 def exec_main():
@@ -0,0 +1,649 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+
+"""
+
+
+# Copyright (c) 2019 Wolfgang Rohdewald <wolfgang@rohdewald.de>
+# See LICENSE for details.
+
+The tests for restaround. restaround selftest runs them.
+
+"""
+
+# pylint: disable=missing-docstring, invalid-name, line-too-long, too-many-lines
+
+import os
+import shutil
+import tempfile
+import filecmp
+import platform
+
+import pytest
+
+from . import restaround
+from .restaround import PyPath, Main, Profile, ProfileEntry, CmdCpal, script_path
+
+
+class Test_restaround:
+
+    # pylint: disable=too-many-public-methods
+
+    profiles = []
+    tmpdir = None
+    test_env = None
+    repo1 = None
+
+    def setup_method(self):
+        self.tmpdir = PyPath(tempfile.mkdtemp())
+        Main.init_globals()
+        restaround.PATHS = (self.tmpdir / 'etc', self.tmpdir / 'user')
+        self.profiles = {}
+        self.test_env = os.environ.copy()
+        self.repo1 = self.tmpdir / 'repösitory 1 €=EUR'
+
+    def teardown_method(self):
+        shutil.rmtree(str(self.tmpdir))
+        self.profiles = {}
+
+    @staticmethod
+    def is_script(key):
+        return 'pre' in key.split('_') or 'post' in key.split('_')
+
+    def define_profile(self, path_idx, name, content):
+        path = restaround.PATHS[path_idx] / 'restaround' / name
+        path.mkdir(parents=True)
+        self.profiles[name] = path
+        for key, value in content.items():
+            full_path = script_path(path / key)
+            if value is None:
+                full_path.touch()
+            else:
+                if platform.system() == 'Windows' and isinstance(value, str):
+                    value = value.replace('#!/bin/bash', '')
+                    value = value.replace('REPOFILE', str(path / 'repo'))
+                full_path.write_text(str(value) + '\n')
+                if self.is_script(key):
+                    full_path.chmod(0o755)
+        return path
+
+    @staticmethod
+    def compare_history(got_history, expect_hist):
+        assert len(got_history) == len(expect_hist), 'got:%s' % got_history
+        for idx, expect_entry in enumerate(expect_hist):
+            got = got_history[idx]
+            assert expect_entry[0] == got[0], 'RUN command differs'
+            assert expect_entry[1] == got[1], 'exit code differs for {0}'.format(got[0])
+            for key, value in expect_entry[2].items():
+                assert value == got[2][key], 'value of {0} differs'.format(key)
+
+    @staticmethod
+    def compare_directories(a, b):
+        cmp = filecmp.dircmp(str(a), str(b))
+        assert not cmp.left_only
+        assert not cmp.right_only
+        assert not cmp.diff_files
+
+    def run_test(self, profile, args, expect):
+        Main.run_history = []
+        argv = ['restaround', '--loglevel=debug', profile.name]
+        argv.extend(args)
+        main = Main([str(x) for x in argv])
+        self.compare_history(main.run_history, expect)
+
+    def run_init(self, profile):
+        repo = ProfileEntry(profile / 'repo').flag().values[0]
+        self.run_test(profile, ['init'], [(
+            'RUN restic init --password-file={0} --repo={1}'.format(
+                profile / 'password-file',
+                repo,
+            ), 0, {}), ])
+        assert (repo / 'locks').is_dir()
+
+    def test_init(self):
+        profile = self.define_profile(1, 'profile with Umläut', {
+            'repo': self.repo1,
+            'password-file': 'secret password'})
+        self.run_init(profile)
+
+    @pytest.mark.skipif(platform.system() != 'Linux', reason='not for Linux')
+    def test_script_path_linux(self):
+        profile_name = 'profile with Umlaut'
+        profile = self.define_profile(1, profile_name, {
+            'repo': self.repo1,
+            'pre': '\n'.join([
+                '#!/bin/bash',
+                'echo VALB=$0'
+                ]),
+            'password-file': 'secret password'})
+        prof = Profile()
+        Main.command = 'init'  # needed for inherit()
+        prof.inherit(profile_name)
+        self.run_test(profile, ['init'], [
+            ('RUN ' + str(script_path(profile / 'pre')), 0, {'VALB': str(next(prof.pre_scripts()))}),
+            ('RUN restic init --password-file={0} --repo={1}'.format(
+                profile / 'password-file',
+                self.repo1,
+            ), 0, {})])
+
+    @pytest.mark.skipif(platform.system() != 'Windows', reason='only for Windows')
+    def test_script_path_windows(self):
+        profile_name = 'profile with Umlaut'
+        profile = self.define_profile(1, profile_name, {
+            'repo': self.repo1,
+            'pre': '\n'.join([
+                '@echo off',
+                'echo VALB=%0'
+                ]),
+            'password-file': 'secret password'})
+        prof = Profile()
+        Main.command = 'init'  # needed for inherit()
+        prof.inherit(profile_name)
+        self.run_test(profile, ['init'], [
+            ('RUN ' + str(script_path(profile / 'pre')), 0, {'VALB': str(next(prof.pre_scripts()))}),
+            ('RUN restic init --password-file={0} --repo={1}'.format(
+                profile / 'password-file',
+                self.repo1,
+            ), 0, {})])
+
+    @pytest.mark.skipif(platform.system() != 'Linux', reason='only for Linux')
+    def test_pre_fail_linux(self):
+        profile = self.define_profile(1, 'my_profile', {
+            'repo': self.repo1,
+            'pre': '\n'.join([
+                '#!/bin/bash',
+                'echo "VALA=bcde=f"',
+                'exit 0']),
+            'init_pre': '\n'.join([
+                '#!/bin/bash',
+                'echo "VALB=ccde=f"',
+                'echo "RA_DR=$RESTAROUND_DRY_RUN"',
+                'echo "RA_PID=$RESTAROUND_PID"',
+                'echo "RA_PR=$RESTAROUND_PROFILE"',
+                'echo "RA_LL=$RESTAROUND_LOGLEVEL"',
+                'exit 3']),
+            'password-file': 'secret password'})
+        self.run_test(profile, ['init'], [
+            ('RUN ' + str(script_path(profile / 'pre')), 0, {'VALA': 'bcde=f'}),
+            ('RUN ' + str(script_path(profile / 'init_pre')), 3, {
+                'VALA': 'bcde=f', 'VALB': 'ccde=f',
+                'RA_DR': '0', 'RA_PID': str(os.getpid()),
+                'RA_PR': 'my_profile', 'RA_LL': 'debug'})])
+
+    @pytest.mark.skipif(platform.system() != 'Windows', reason='only for Windows')
+    def test_pre_fail_windows(self):
+        profile = self.define_profile(1, 'my_profile', {
+            'repo': self.repo1,
+            'pre': '\n'.join([
+                '@echo off',
+                'echo VALA=bcde=f',
+                'exit 0']),
+            'init_pre': '\n'.join([
+                '@echo off',
+                'echo "VALB=ccde=f"',
+                'echo "RA_DR=%RESTAROUND_DRY_RUN%"',
+                'echo "RA_PID=%RESTAROUND_PID%"',
+                'echo "RA_PR=%RESTAROUND_PROFILE%"',
+                'echo "RA_LL=%RESTAROUND_LOGLEVEL%"',
+                'exit 3']),
+            'password-file': 'secret password'})
+        self.run_test(profile, ['init'], [
+            ('RUN ' + str(script_path(profile / 'pre')), 0, {'VALA': 'bcde=f'}),
+            ('RUN ' + str(script_path(profile / 'init_pre')), 3, {
+                'VALA': 'bcde=f', 'VALB': 'ccde=f',
+                'RA_DR': '0', 'RA_PID': str(os.getpid()),
+                'RA_PR': 'my_profile', 'RA_LL': 'debug'}),
+            ])
+
+    def test_pre_post(self):
+        profile = self.define_profile(1, 'my_profile', {
+            'repo': self.repo1,
+            'pre': '\n'.join([
+                '#!/bin/bash',
+                'echo VALA="bcde=f"',
+                'exit 0']),
+            'init_pre': '\n'.join([
+                '#!/bin/bash',
+                'echo "VALB=ccde=f"',
+                'exit 0']),
+            'post': '\n'.join([
+                '#!/bin/bash',
+                'exit 0']),
+            'password-file': 'secret password'})
+        self.run_test(profile, ['init'], [
+            ('RUN ' + str(script_path(profile / 'pre')), 0, {}),
+            ('RUN ' + str(script_path(profile / 'init_pre')), 0, {}),
+            ('RUN restic init --password-file={0} --repo={1}'.format(
+                profile / 'password-file',
+                self.repo1,
+            ), 0, {}),
+            ('RUN ' + str(script_path(profile / 'post')), 0, {})])
+
+    def test_path(self):
+        profile = self.define_profile(1, 'my_profile', {
+            'repo': self.repo1,
+            'password-file': 'secret password',
+            'path': '/path1\n/path2'})
+        self.run_test(profile, ['init'], [(
+            'RUN restic init --password-file={0} --repo={1}'.format(
+                profile / 'password-file',
+                self.repo1,
+            ), 0, {}), ])
+        self.run_test(profile, ['snapshots'], [(
+            'RUN restic snapshots --password-file={0} --repo={1} --path=/path1 --path=/path2'.format(
+                profile / 'password-file',
+                self.repo1,
+            ), 0, {}), ])
+
+    def test_excludefile2(self):
+        """Have 2 exclude-files"""
+        default_profile = self.define_profile(0, 'default', {
+            'exclude-file': 'default_filea\ndefault_dirb\ndefault_dirc\n'})
+        profile = self.define_profile(1, 'my_profile', {
+            'repo': self.repo1,
+            'exclude-file': '_filea\n_dirb\n_dirc\n',
+            'password-file': 'secret password',
+            'path': '/path1\n/path2'})
+        self.run_init(profile)
+        self.run_test(profile, ['backup', restaround.PATHS[0]], [(
+            'RUN restic backup --password-file={0} --repo={1} --exclude-file={2} --exclude-file={3} {4}'.format(
+                profile / 'password-file',
+                self.repo1,
+                default_profile / 'exclude-file',
+                profile / 'exclude-file',
+                restaround.PATHS[0]), 0, {}), ])
+
+    def test_order(self):
+        self.define_profile(0, 'default', {
+            'verbose': '1',
+            'exclude-caches': None})
+        self.define_profile(1, 'profile repo', {
+            'repo': self.repo1})
+        profile = self.define_profile(1, 'Real profile with Umläut', {
+            'verbose_4': None,
+            'init_verbose_3': None,
+            'inherit_profile repo': None,
+            'password-file': 'secret password'})
+        profile3 = self.define_profile(1, 'level3', {
+            'backup_no_verbose': None,
+            'inherit': 'Real profile with Umläut'})
+        self.run_test(profile, ['init'], [(
+            'RUN restic init --password-file={0} --repo={1} --verbose=3'.format(
+                profile / 'password-file',
+                self.repo1,
+            ), 0, {}), ])
+        self.run_test(profile3, ['backup', restaround.PATHS[0]], [(
+            'RUN restic backup --password-file={0} --repo={1} --exclude-caches {2}'.format(
+                profile / 'password-file',
+                self.repo1,
+                restaround.PATHS[0]), 0, {}), ])
+        self.run_test(profile, ['backup', '--verbose=9', restaround.PATHS[0]], [(
+            'RUN restic backup --password-file={0} --repo={1} --verbose=9 --exclude-caches {2}'.format(
+                profile / 'password-file',
+                self.repo1,
+                restaround.PATHS[0]), 0, {}), ])
+
+    def test_profile_without_command(self):
+        """An empty profile does not need Main.command"""
+        self.define_profile(0, 'default', {})
+        Main.command = None
+        prof = Profile()
+        assert not prof.flags
+
+    def test_values_in_name_and_file(self):
+        """Also for files of other commands, and with .bat on Windows"""
+        Main.command = 'backup'
+        self.define_profile(1, 'pr', {
+            'forget_keep-tag_a_b': 'c'})
+        with pytest.raises(SystemExit) as exc:
+            Profile().inherit('pr')
+        assert exc.value.code == 2
+        self.define_profile(1, 'windows', {
+            'forget_keep-tag_a_b.bat': 'c'})
+        saved = restaround.SYSTEM
+        restaround.SYSTEM = 'Windows'
+        try:
+            with pytest.raises(SystemExit) as exc:
+                Profile().inherit('windows')
+        finally:
+            restaround.SYSTEM = saved
+        assert exc.value.code == 2
+
+    def test_command_set_after_profile(self):
+        """The flags accepted by the command are not taken from an older command"""
+        self.define_profile(0, 'default', {
+            'repo': self.repo1})
+        self.define_profile(1, 'pr', {
+            'exclude-caches': None})
+        Main.command = 'init'
+        prof = Profile()
+        Main.command = 'backup'
+        prof.inherit('pr')
+        assert list(prof.restic_parameters()) == [
+            '--repo={0}'.format(self.repo1), '--exclude-caches']
+
+    def test_inherit_diamond(self):
+        """a inherits b and c, both inherit d: d is only applied once"""
+        self.define_profile(1, 'd', {
+            'repo': self.tmpdir / 'repo_d',
+            'exclude': 'd'})
+        self.define_profile(1, 'b', {
+            'inherit': 'd',
+            'repo': self.tmpdir / 'repo_b',
+            'exclude': 'b'})
+        self.define_profile(1, 'c', {
+            'inherit': 'd',
+            'exclude': 'c'})
+        self.define_profile(1, 'a', {
+            'inherit': 'b\nc'})
+        Main.command = 'backup'
+        prof = Profile()
+        prof.inherit('a')
+        assert list(prof.restic_parameters()) == [
+            '--repo={0}'.format(self.tmpdir / 'repo_b'),
+            '--exclude=d', '--exclude=b', '--exclude=c']
+
+    def test_inherit_cycle(self):
+        self.define_profile(1, 'a', {
+            'inherit': 'b',
+            'repo': self.repo1})
+        self.define_profile(1, 'b', {
+            'inherit': 'a',
+            'exclude': 'b'})
+        Main.command = 'backup'
+        prof = Profile()
+        prof.inherit('a')
+        assert list(prof.restic_parameters()) == [
+            '--repo={0}'.format(self.repo1), '--exclude=b']
+
+    def test_parallel_scan(self):
+        """Reading the profile files in parallel gives the same flags"""
+        self.define_profile(1, 'pr', {
+            'repo': self.repo1,
+            'password-file': 'secret password',
+            'exclude': 'a\nb',
+            'exclude-file': 'c',
+            'exclude-caches': None,
+            'tag_x_y': None})
+        Main.command = 'backup'
+        serial = Profile()
+        serial.inherit('pr')
+        saved = Profile.parallel_scan_min
+        Profile.parallel_scan_min = 1
+        try:
+            parallel = Profile()
+            parallel.inherit('pr')
+        finally:
+            Profile.parallel_scan_min = saved
+        assert list(parallel.restic_parameters()) == list(serial.restic_parameters())
+
+    @staticmethod
+    def parse_both(argv, capsys):
+        """Parse argv with the parser Main builds for it and with a parser
+        where all commands have their flags. Both must agree."""
+        results = []
+        for commands in (Main.commands_needing_flags(argv), Main.commands.keys()):
+            parser = Main.build_parser(commands)
+            try:
+                result = vars(parser.parse_args(argv[1:]))
+            except SystemExit as exc:
+                result = exc.code
+            results.append((result, capsys.readouterr()))
+        assert results[0] == results[1]
+        return results[0][0]
+
+    def test_command_finder(self, capsys):
+        self.define_profile(1, 'pr', {
+            'repo': self.repo1})
+        result = self.parse_both(['restaround', 'pr', '-n', 'init'], capsys)
+        assert result['dry'] and result['subparser_name'] == 'init'
+        result = self.parse_both(['restaround', 'help', 'backup'], capsys)
+        assert result['profile'] == ['help'] and result['subparser_name'] == 'backup'
+        assert self.parse_both(['restaround', '-h'], capsys) == 0
+        assert self.parse_both(['restaround', '--help'], capsys) == 0
+        result = self.parse_both(['restaround', 'selftest'], capsys)
+        assert result['profile'] == ['selftest'] and result['subparser_name'] is None
+        assert self.parse_both(['restaround', 'pr', 'nosuchcommand'], capsys) == 2
+
+    def test_parser_reuse(self):
+        """Main() reuses its parser: every command still only gets its own flags"""
+        self.define_profile(1, 'pr', {
+            'repo': self.repo1})
+        Main(['restaround', '-n', 'pr', 'backup', '--exclude-caches', str(self.tmpdir)])
+        assert Main.options.exclude_caches
+        with pytest.raises(SystemExit) as exc:
+            Main(['restaround', '-n', 'pr', 'init', '--exclude-caches'])
+        assert exc.value.code == 2
+        Main(['restaround', '-n', 'pr', 'init'])
+        assert not hasattr(Main.options, 'exclude_caches')
+        parser = Main.parser
+        self.define_profile(1, 'new profile', {
+            'repo': self.repo1})
+        Main(['restaround', '-n', 'new profile', 'init'])
+        assert Main.parser is parser
+        assert Main.options.profile == 'new profile'
+        Main(['restaround', '-n', 'new profile', 'backup', '--exclude-caches', str(self.tmpdir)])
+        assert Main.options.exclude_caches
+
+    def test_tag(self):
+        profile = self.define_profile(1, 'pr', {
+            'repo': self.repo1,
+            'add_one_two_tag': None,
+            'add': 'four\nfive',
+            'host_mysystem_othersystem': None,
+            'path': '/',
+            'set': 'overwrite',
+            'snapshotid': 'SNID\nID2',
+            'password-file': 'secret password'})
+        self.run_init(profile)
+        self.run_test(profile, ['tag'], [(
+            'RUN restic tag --password-file={0} --repo={1} --add=four --add=five --add=one --add=two --add=tag ' \
+            '--host=mysystem --host=othersystem --path=/ --set=overwrite SNID ID2'.format(
+                profile / 'password-file', self.repo1), 1, {})])
+
+    @pytest.mark.skipif(platform.system() != 'Linux', reason='Only for Linux')
+    def test_rescan_linux(self):
+        default_profile = self.define_profile(0, 'default', {
+            'password-file': 'secret password',
+            'pre': '\n'.join([
+                '#!/bin/bash',
+                'filename=$(dirname $0)/repo',
+                'echo {0} >$filename'.format(self.repo1)]),
+            'exclude-caches': None})
+        profile = self.define_profile(0, 'real', {
+            'password-file': 'secret password'
+            })
+        self.run_test(profile, ['init'], [
+            ('RUN ' + str(script_path(default_profile / 'pre')), 0, {}),
+            ('RUN restic init --password-file={0} --repo={1}'.format(
+                profile / 'password-file',
+                self.repo1,
+            ), 0, {}), ])
+
+    @pytest.mark.skipif(platform.system() != 'Linux', reason='only for Linux')
+    def test_rescan_rewritten(self):
+        """A pre script rewrites a file that was already read"""
+        repo2 = self.tmpdir / 'repösitory 2 €=EUR'
+        profile = self.define_profile(1, 'pr', {
+            'repo': self.repo1,
+            'password-file': 'secret password',
+            'pre': '\n'.join([
+                '#!/bin/bash',
+                'echo "{0}" >"$(dirname "$0")/repo"'.format(repo2)])})
+        self.run_test(profile, ['init'], [
+            ('RUN ' + str(script_path(profile / 'pre')), 0, {}),
+            ('RUN restic init --password-file={0} --repo={1}'.format(
+                profile / 'password-file',
+                repo2,
+            ), 0, {}), ])
+
+    @pytest.mark.skipif(platform.system() != 'Windows', reason='only for Windows')
+    def test_rescan_windows(self):
+        default_profile = self.define_profile(0, 'default', {
+            'password-file': 'secret password',
+            'pre': '\n'.join([
+                '@echo off',
+                'echo {0} >REPOFILE'.format(self.repo1)]),
+            'exclude-caches': None})
+        profile = self.define_profile(0, 'real', {
+            'password-file': 'secret password'
+            })
+        self.run_test(profile, ['init'], [
+            ('RUN ' + str(script_path(default_profile / 'pre')), 0, {}),
+            ('RUN restic init --password-file={0} --repo={1}'.format(
+                profile / 'password-file',
+                self.repo1,
+            ), 0, {}), ])
+
+    def test_backup(self):
+        parent_profile = self.define_profile(1, 'parent', {
+            'repo': self.repo1,
+            'password-file': 'secret password',
+            })
+        profile = self.define_profile(1, 'pr', {
+            'add_one_two_tag': None,
+            'inherit_parent': None,
+            'add': 'four\nfive',
+            'host_mysystem': None,
+            'cache-dir': '/tmp',
+            'limit-upload': 500,
+            'limit-download': 1000,
+            'path': '/',
+            'filedir': restaround.PATHS[1],
+            'set': 'overwrite',
+            'snapshotid': 'SNID\nID2',
+            })
+        self.run_init(parent_profile)
+        self.run_test(profile, ['backup'], [(
+            'RUN restic backup ' \
+            '--cache-dir={0}tmp --limit-download=1000 --limit-upload=500 ' \
+            '--password-file={1} --repo={2} --host=mysystem {3}'.format(
+                os.sep,
+                parent_profile / 'password-file',
+                self.repo1, restaround.PATHS[1],
+                ), 0, {})])
+
+    def test_snapshots_forget(self):
+        parent_profile = self.define_profile(1, 'parent', {
+            'repo': self.repo1,
+            'filedir': restaround.PATHS[1],
+            'password-file': 'secret password'})
+        profile = self.define_profile(1, 'pr', {
+            'inherit_parent': None,
+            'add_one_two_tag': None,
+            'add': 'four\nfive',
+            'keep-last': 5,
+            'keep-hourly': 6,
+            'keep-monthly': 7,
+            'keep-yearly': 8,
+            'keep-within': '1y5m7d2h',
+            'keep-tag_a_b': None,
+            'host_mysystem': None,
+            'tag_a_b_c': None,
+            'compact': None,
+            'group-by': 'paths',
+            'prune': None,
+            'set': 'overwrite',
+            })
+        self.run_init(parent_profile)
+        self.run_test(profile, ['backup'], [(
+            'RUN restic backup ' \
+            '--password-file={0} --repo={1} ' \
+            '--host=mysystem --tag=a --tag=b --tag=c {2}'.format(
+                parent_profile / 'password-file',
+                self.repo1,
+                restaround.PATHS[1],
+            ), 0, {})])
+        self.run_test(profile, ['snapshots'], [(
+            'RUN restic snapshots ' \
+            '--password-file={0} --repo={1} --compact --group-by=paths ' \
+            '--host=mysystem ' \
+            '--tag=a --tag=b --tag=c'.format(
+                parent_profile / 'password-file', self.repo1), 0, {})])
+        self.run_test(profile, ['ls', '--recursive', 'latest', '/'], [(
+            'RUN restic ls ' \
+            '--password-file={0} --repo={1} ' \
+            '--host=mysystem --recursive ' \
+            '--tag=a --tag=b --tag=c latest /'.format(
+                parent_profile / 'password-file', self.repo1), 0, {})])
+        self.run_test(profile, ['forget', 'latest'], [(
+            'RUN restic forget ' \
+            '--password-file={0} --repo={1} ' \
+            '--keep-last=5 ' \
+            '--keep-hourly=6 --keep-monthly=7 --keep-yearly=8 --keep-within=1y5m7d2h ' \
+            '--keep-tag=a --keep-tag=b --host=mysystem --tag=a --tag=b --tag=c --compact --group-by=paths --prune latest'.format(
+                parent_profile / 'password-file', self.repo1), 0, {})])
+
+    @pytest.mark.skipif(platform.system() != 'Linux', reason='Windows: restore path problem')
+    def test_restore(self):
+        target_dir = self.tmpdir / 'restore_target'
+        profile = self.define_profile(1, 'pr', {
+            'repo': self.repo1,
+            'filedir': restaround.PATHS[1],
+            'exclude': 'patterna\n**.tmp\n/cache',
+            'password-file': 'secret password',
+            'target': target_dir,
+            })
+        self.run_init(profile)
+        self.run_test(profile, ['backup'], [(
+            'RUN restic backup ' \
+            '--password-file={0} --repo={1} ' \
+            '--exclude=patterna --exclude=**.tmp --exclude=/cache {2}'.format(
+                profile / 'password-file',
+                self.repo1,
+                restaround.PATHS[1]), 0, {}), ])
+        self.run_test(profile, ['restore', 'latest'], [(
+            'RUN restic restore ' \
+            '--password-file={0} --repo={1} ' \
+            '--exclude=patterna --exclude=**.tmp --exclude=/cache --target={2} latest'.format(
+                profile / 'password-file',
+                self.repo1, target_dir,
+                ), 0, {}), ])
+        self.compare_directories(restaround.PATHS[1], target_dir / PyPath(str(self.tmpdir)[1:]) / 'user')
+
+    @pytest.mark.skipif(not CmdCpal.is_supported(), reason='not supported on Windows')
+    def test_cpal(self):
+        # 1. normal, mit rmcpal
+        # 2. repo=sftp....
+        profile = self.define_profile(1, 'pr', {
+            'repo': self.repo1,
+            'filedir': restaround.PATHS[1],
+            'password-file': 'secret password',
+            })
+        self.run_init(profile)
+        self.run_test(profile, ['backup'], [(
+            'RUN restic backup ' \
+            '--password-file={0} --repo={1} {2}'.format(
+                profile / 'password-file',
+                self.repo1,
+                restaround.PATHS[1]), 0, {}), ])
+
+        cp_path = PyPath(str(self.repo1) + '.restaround_cpal')
+        self.run_test(profile, ['cpal'], [(
+            'RUN cp -al {0} {1}'.format(
+                self.repo1,
+                str(cp_path)), 0, {}), ])
+        assert cp_path.exists()
+        self.compare_directories(self.repo1, cp_path)
+        self.run_test(profile, ['rmcpal'], [(
+            'RUN rm -r {0}'.format(str(cp_path)), 0, {}), ])
+        assert not cp_path.exists()
+
+    @pytest.mark.skipif(not CmdCpal.is_supported(), reason='not supported on Windows')
+    def test_cpal_repo_option(self):
+        """--repo from the command line is a str"""
+        profile = self.define_profile(1, 'pr', {
+            'password-file': 'secret password',
+            })
+        (self.repo1 / 'data').mkdir(parents=True)
+        (self.repo1 / 'config').write_text('config')
+        cp_path = PyPath(str(self.repo1) + '.restaround_cpal')
+        self.run_test(profile, ['cpal', '--repo={0}'.format(self.repo1)], [(
+            'RUN cp -al {0} {1}'.format(
+                self.repo1,
+                str(cp_path)), 0, {}), ])
+        self.compare_directories(self.repo1, cp_path)
+        self.run_test(profile, ['rmcpal', '--repo={0}'.format(self.repo1)], [(
+            'RUN rm -r {0}'.format(str(cp_path)), 0, {}), ])
+        assert not cp_path.exists()
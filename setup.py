@@ -4,6 +4,7 @@
 """see https://setuptools.readthedocs.io/en/latest/setuptools.html."""
 
 
+import re
 from setuptools import setup, find_packages
 COPYRIGHT = """
 Copyright (c) 2019 Wolfgang Rohdewald <wolfgang@rohdewald.de>
@@ -22,9 +23,8 @@ def readall(path):
         return in_file.read()
 
 
-version_data = readall('restaround/restaround.py')
-version_line = [x for x in version_data.split('\n') if 'VERSION' in x][0].strip()
-version = version_line.split('"')[1]
+version = re.search(
+    r'^VERSION = "([^"]+)"', readall('restaround/restaround.py'), re.MULTILINE).group(1)
 
 setup(
     name='restaround',